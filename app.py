@@ -8,8 +8,17 @@ import os
 import re
 import json
 import random
+import asyncio
+import threading
+import sys
+from collections import OrderedDict, deque
+from dataclasses import dataclass, fields, is_dataclass, replace
+from types import MappingProxyType
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from urllib.parse import quote
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # --- [1] 페이지 기본 설정 ---
 st.set_page_config(layout="wide", page_title="Golden Key Pro | 퀀트 대시보드")
@@ -240,10 +249,8 @@ st.markdown(
 if 'global_indices' not in st.session_state: st.session_state.global_indices = []
 if 'global_themes' not in st.session_state: st.session_state.global_themes = []
 if 'global_briefing' not in st.session_state: st.session_state.global_briefing = "글로벌 스캔을 실행해주세요."
-if 'domestic_df' not in st.session_state: st.session_state.domestic_df = pd.DataFrame()
-if 'analysis_results' not in st.session_state: st.session_state.analysis_results = []
-if 'market_briefing' not in st.session_state: st.session_state.market_briefing = ""
-if 'news_payload' not in st.session_state: st.session_state.news_payload = {} 
+# 국내 스캔 결과는 서버 공용 스냅샷 저장소에 한 번만 보관하고, 세션은 버전 번호만 참조
+if 'snapshot_version' not in st.session_state: st.session_state.snapshot_version = None
 
 # ==========================================
 # 🌟 전역 설정 (섹터 색상 동기화 및 헬퍼 함수)
@@ -265,7 +272,7 @@ def get_sector_color(sector_name):
 def force_list(val):
     if isinstance(val, str):
         return [val]
-    if isinstance(val, list):
+    if isinstance(val, (list, tuple)):
         if len(val) > 1 and all(len(str(x)) == 1 for x in val):
             return ["".join(str(x) for x in val)]
         return [str(x) for x in val]
@@ -366,7 +373,28 @@ def get_global_market_status():
 
 # --- [3] 💡 종목 정밀 분석 엔진 (Gemini) ---
 
-def fetch_stock_news_headlines(stock_name):
+PORTAL_REQUEST_INTERVAL = 1.0  # 포털별 최소 요청 간격(초) - 차단 방지
+
+class PortalRateLimiter:
+    """포털별 요청 간격을 모든 뉴스 워커·세션이 공유하는 제한기"""
+
+    def __init__(self, interval=PORTAL_REQUEST_INTERVAL):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, portal):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(portal, now))
+            self._next_slot[portal] = slot + self._interval
+        time.sleep(slot - now)
+
+@st.cache_resource
+def get_portal_rate_limiter():
+    return PortalRateLimiter()
+
+def fetch_stock_news_headlines(stock_name, rate_limiter=None):
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
@@ -378,6 +406,7 @@ def fetch_stock_news_headlines(stock_name):
     try:
         encoded_kw = quote(f"특징주 {stock_name}", encoding='euc-kr')
         fin_url = f"https://finance.naver.com/news/news_search.naver?q={encoded_kw}"
+        if rate_limiter: rate_limiter.wait('naver')
         res_fin = requests.get(fin_url, headers=headers, timeout=5)
         res_fin.encoding = 'euc-kr'
         
@@ -411,6 +440,7 @@ def fetch_stock_news_headlines(stock_name):
         try:
             daum_url = f"https://search.daum.net/search?w=news&q={quote('특징주 ' + stock_name)}"
             headers['Referer'] = "https://search.daum.net/"
+            if rate_limiter: rate_limiter.wait('daum')
             res_daum = requests.get(daum_url, headers=headers, timeout=5)
             if res_daum.status_code == 200:
                 soup_daum = BeautifulSoup(res_daum.text, 'html.parser')
@@ -441,14 +471,135 @@ def fetch_stock_news_headlines(stock_name):
         
     return titles[:10]
 
+# Gemini 구조화 출력(JSON 모드)에 선언하는 응답 스키마
+ANALYSIS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "시장브리핑": {"type": "string"},
+        "종목분석": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "종목명": {"type": "string"},
+                    "분석과정": {"type": "string"},
+                    "섹터": {"type": "array", "items": {"type": "string"}},
+                    "이유": {"type": "string"},
+                },
+                "required": ["종목명", "섹터", "이유"],
+            },
+        },
+    },
+    "required": ["시장브리핑", "종목분석"],
+}
+
+@dataclass(frozen=True)
+class StockAnalysis:
+    """검증을 통과한 종목별 AI 분석 결과"""
+    name: str
+    sectors: tuple
+    reason: str
+    reasoning: str = "추론 데이터가 없습니다."
+
+def to_stock_analysis(item):
+    """모델이 준 종목분석 객체를 검증해 StockAnalysis로 변환 (종목명이 없으면 None)"""
+    if not isinstance(item, dict):
+        return None
+    name = item.get("종목명")
+    if not isinstance(name, str) or not name.strip():
+        return None
+    reason = item.get("이유")
+    reasoning = item.get("분석과정")
+    return StockAnalysis(
+        name=sys.intern(name.strip()),
+        sectors=tuple(sys.intern(sec) for sec in force_list(item.get("섹터"))),
+        reason=reason.strip() if isinstance(reason, str) and reason.strip() else "최근 뚜렷한 재료 발견 안됨",
+        reasoning=reasoning.strip() if isinstance(reasoning, str) and reasoning.strip() else "추론 데이터가 없습니다.",
+    )
+
+_JSON_DECODER = json.JSONDecoder()
+_ITEM_START = re.compile(r'\{\s*"종목명"')
+
+def _decode_at(text, pos):
+    """pos 위치의 JSON 값 하나를 디코딩. 잘렸거나 깨진 값이면 (None, pos)"""
+    try:
+        return _JSON_DECODER.raw_decode(text, pos)
+    except json.JSONDecodeError:
+        return None, pos
+
+def _skip_chars(text, pos, chars=' \t\r\n'):
+    while pos < len(text) and text[pos] in chars:
+        pos += 1
+    return pos
+
+def salvage_analysis_json(text):
+    """응답에서 (시장브리핑, 종목분석 객체 목록) 추출. 잘리거나 잡음이 섞인 출력에서도 완결된 종목 객체는 모두 살린다"""
+    start = text.find('{')
+    if start >= 0:
+        parsed, _ = _decode_at(text, start)
+        # 앞쪽 잡음 속 '{}' 같은 무관한 객체는 무시하고 키 단위 복구로 넘어감
+        if isinstance(parsed, dict) and "종목분석" in parsed:
+            items = parsed.get("종목분석")
+            return parsed.get("시장브리핑"), items if isinstance(items, list) else []
+    
+    # 전체 파싱 실패 → 키 위치부터 값 단위로 디코딩
+    briefing = None
+    key = text.find('"시장브리핑"')
+    if key >= 0:
+        pos = _skip_chars(text, key + len('"시장브리핑"'))
+        if text[pos:pos + 1] == ':':
+            value, _ = _decode_at(text, _skip_chars(text, pos + 1))
+            if isinstance(value, str):
+                briefing = value
+    
+    items = []
+    key = text.find('"종목분석"')
+    pos = text.find('[', key) if key >= 0 else -1
+    if pos >= 0:
+        pos += 1
+        while True:
+            pos = _skip_chars(text, pos, ' \t\r\n,')
+            if text[pos:pos + 1] != '{':
+                break
+            value, end = _decode_at(text, pos)
+            if value is None:
+                # 중간 객체가 깨졌으면 다음 종목 객체로 건너뛰고, 뒤에 더 없으면(잘린 마지막 객체) 종료
+                next_item = _ITEM_START.search(text, pos + 1)
+                if next_item is None:
+                    break
+                pos = next_item.start()
+                continue
+            items.append(value)
+            pos = end
+    return briefing, items
+
+def _analysis_generation_config(structured=True):
+    if structured:
+        try:
+            return genai.types.GenerationConfig(
+                temperature=0.1, top_p=0.8,
+                response_mime_type="application/json",
+                response_schema=ANALYSIS_RESPONSE_SCHEMA,
+            )
+        except TypeError:
+            pass  # 구조화 출력을 지원하지 않는 구버전 SDK → 프롬프트 지시 + 관대한 파서로 처리
+    return genai.types.GenerationConfig(temperature=0.1, top_p=0.8)
+
+def generate_analysis_text(prompt):
+    """구조화 출력으로 요청하고, API가 스키마를 거부(InvalidArgument)하면 스키마 없이 한 번만 재요청"""
+    try:
+        analysis_model = genai.GenerativeModel('gemini-2.5-flash', generation_config=_analysis_generation_config())
+        return analysis_model.generate_content(prompt).text
+    except google_exceptions.InvalidArgument:
+        analysis_model = genai.GenerativeModel('gemini-2.5-flash', generation_config=_analysis_generation_config(structured=False))
+        return analysis_model.generate_content(prompt).text
+
 def perform_batch_analysis(news_map):
+    """(시장브리핑, 분석 레코드 목록, 성공 여부) 반환. 실패 시 화면 표시용 오류 레코드를 돌려준다"""
     if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY":
-        return "API 키 누락", [{"종목명": "오류", "섹터": ["시스템"], "이유": "API 키가 설정되지 않았습니다.", "기사날짜": "-"}]
+        return "API 키 누락", [StockAnalysis(name="오류", sectors=("시스템",), reason="API 키가 설정되지 않았습니다.")], False
     
     try:
-        generation_config = genai.types.GenerationConfig(temperature=0.1, top_p=0.8)
-        analysis_model = genai.GenerativeModel('gemini-2.5-flash', generation_config=generation_config)
-        
         # 💡 [프롬프트 핵심 개선] 대표님이 요청하신 스페이스X 및 테마 규격화 버전 적용
         prompt = f"""
         당신은 여의도 최고 수준의 프랍 트레이더이자 시장 트렌드 분석의 권위자입니다.
@@ -504,24 +655,58 @@ def perform_batch_analysis(news_map):
           ]
         }}
         """
-        response = analysis_model.generate_content(prompt)
-        raw_text = response.text.strip()
-        # JSON 파싱 안정화: 모든 백틱 및 부가 설명 제거 강화 (image_3391bc.png 에러 방지)
-        raw_text = re.sub(r"^[^{]*", "", raw_text) 
-        raw_text = re.sub(r"[^}]*$", "", raw_text)
+        briefing, raw_items = salvage_analysis_json(generate_analysis_text(prompt))
+        if briefing is None and not raw_items:
+            raise ValueError("응답에서 분석 JSON을 찾지 못했습니다.")
         
-        parsed_json = json.loads(raw_text)
-        briefing = parsed_json.get("시장브리핑", "오늘 시장의 주도 테마 브리핑을 생성하지 못했습니다.")
-        stock_analysis = parsed_json.get("종목분석", [])
+        if not isinstance(briefing, str) or not briefing.strip():
+            briefing = "오늘 시장의 주도 테마 브리핑을 생성하지 못했습니다."
+        stock_analysis = [rec for rec in map(to_stock_analysis, raw_items) if rec is not None]
         
-        return briefing, stock_analysis
+        return briefing, stock_analysis, True
         
     except Exception as e:
-        return f"분석 중 오류 발생: {e}", [{"종목명": "시스템 에러", "분석과정": "오류 발생", "섹터": ["오류"], "이유": "AI 분석 실패", "기사날짜": "-"}]
+        return f"분석 중 오류 발생: {e}", [StockAnalysis(name="시스템 에러", sectors=("오류",), reason="AI 분석 실패", reasoning="오류 발생")], False
+
+def perform_final_briefing(records):
+    """청크별 분석을 합친 전체 종목의 태그를 다시 통일하고 단일 시장 브리핑 작성. (브리핑, 종목명→섹터) 반환, 실패 시 (None, {})"""
+    data = [{"종목명": rec.name, "섹터": list(rec.sectors), "이유": rec.reason} for rec in records]
+    try:
+        prompt = f"""
+        당신은 여의도 최고 수준의 프랍 트레이더이자 시장 트렌드 분석의 권위자입니다.
+        아래 데이터는 여러 묶음으로 나눠 분석한 오늘의 주도주 {len(data)}개 종목의 섹터 태그와 상승 이유입니다.
+        묶음마다 따로 태그를 붙였기 때문에 같은 테마가 서로 다른 이름으로 표기되어 있을 수 있습니다.
+        
+        [데이터]
+        {json.dumps(data, ensure_ascii=False)}
+        
+        [지시사항 - 반드시 지킬 것]
+        1. 전체 종목을 한꺼번에 보고, 같은 테마를 가리키는 태그는 가장 핵심이 되는 '1~5글자의 짧은 명사' 하나로 통일하세요. (예: "스페이스X 장비 공급", "스페이스X 투자" → "스페이스X")
+        2. '스페이스X', '엔비디아', '테슬라' 등 글로벌 메가 테마는 뒤에 '(개별주)'를 붙이지 말고 명사 하나로 묶으세요.
+        3. 각 종목의 첫 번째 섹터(근본 업종)와 '(개별주)' 태그의 의미는 유지하고 태그 이름만 통일하세요. 종목을 추가하거나 빼지 마세요.
+        4. 통일된 태그를 종합해 오늘 어떤 테마들에 자금이 가장 많이 쏠렸는지 "오늘 시장은 [A] 테마와 [B] 관련주가 시장을 이끌고 있습니다." 형태의 트레이더 브리핑을 2~3줄로 작성하세요. (단, '(개별주)' 태그는 브리핑에서 제외)
+        5. 출력 형식: 아래 예시와 같은 구조의 순수 JSON 포맷으로만 응답하세요. "이유"는 입력 값을 그대로 옮기세요.
+        
+        [예시 포맷]
+        {{
+          "시장브리핑": "오늘 시장은 스페이스X 테마와 로봇/AI 관련주가 시장을 이끌고 있습니다.",
+          "종목분석": [
+            {{"종목명": "서진시스템", "섹터": ["스페이스X", "통신장비"], "이유": "스페이스X 장비 공급 및 실적 기대감"}}
+          ]
+        }}
+        """
+        briefing, raw_items = salvage_analysis_json(generate_analysis_text(prompt))
+        unified = {rec.name: rec.sectors for rec in map(to_stock_analysis, raw_items) if rec is not None}
+        if not isinstance(briefing, str) or not briefing.strip():
+            briefing = None
+        return briefing, unified
+    except Exception:
+        return None, {}
 
 # --- [4] 국내 데이터 크롤링 ---
 
-def fetch_market_data(sosok, market_name):
+def fetch_market_rows(sosok, market_name):
+    """거래량 상위 페이지 수집 (UI 호출 없이 (DataFrame, 에러메시지) 반환 - 워커 스레드에서 호출 가능)"""
     protocol = "https"
     host = "finance.naver.com"
     path = "sise/sise_quant.naver"
@@ -540,18 +725,39 @@ def fetch_market_data(sosok, market_name):
         table = soup.find('table', {'class': 'type_2'})
         
         if not table:
-            st.error(f"[에러] 네이버 금융 접근 차단됨 ({market_name})")
-            return pd.DataFrame()
+            return pd.DataFrame(), f"[에러] 네이버 금융 접근 차단됨 ({market_name})"
             
         data = []
         for tr in table.find_all('tr'):
             tds = tr.find_all('td')
             if len(tds) > 5:
                 data.append({'시장': market_name, '종목명': tds[1].text.strip(), '등락률': tds[4].text.strip(), '거래대금': tds[6].text.strip()})
-        return pd.DataFrame(data)
+        return pd.DataFrame(data), None
     except Exception as e: 
-        st.error(f"[에러] {market_name} 데이터 수집 중 통신 오류: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), f"[에러] {market_name} 데이터 수집 중 통신 오류: {e}"
+
+NOISE_PATTERN = 'KODEX|TIGER|ACE|SOL|KBSTAR|HANARO|KOSEF|ARIRANG|스팩|ETN|선물|인버스|레버리지|VIX|옵션|마이티|히어로즈|TIMEFOLIO'
+
+def parse_numeric_columns(df):
+    df['등락률_num'] = pd.to_numeric(df['등락률'].str.replace(r'%|\+', '', regex=True), errors='coerce')
+    df['거래대금_num'] = pd.to_numeric(df['거래대금'].str.replace(',', ''), errors='coerce')
+    return df
+
+def select_leader_candidates(df):
+    """코스피/코스닥 합산 거래대금 상위 100위 중 +4% 이상 종목을 등락률 순으로 추출"""
+    if df.empty:
+        return df
+    # 1. 노이즈 제거 (KODEX, 스팩 등)
+    df = df[~df['종목명'].str.contains(NOISE_PATTERN, na=False)].copy()
+    
+    # 2. 데이터 타입 변환
+    df = parse_numeric_columns(df)
+    
+    # 🌟 [수정 로직] 코스피/코스닥 합산 후 거래대금 순 상위 100위 추출
+    df = df.sort_values(by='거래대금_num', ascending=False).head(100)
+    
+    # 🌟 [수정 로직] 그중 상승률 4.0% 이상인 종목 필터링 후 등락률 순 정렬
+    return df[df['등락률_num'] >= 4.0].sort_values(by='등락률_num', ascending=False)
 
 def format_volume_to_jo_eok(x_million):
     try:
@@ -561,7 +767,440 @@ def format_volume_to_jo_eok(x_million):
         return f"{eok // 10000}조 {eok % 10000}억" if eok >= 10000 else f"{eok}억"
     except: return str(x_million)
 
-# --- [5] UI 레이아웃 구성 ---
+# --- [5] 비동기 스캔 파이프라인 (랭킹 → 뉴스 → AI 분석 단계별 동시 진행) ---
+
+NEWS_WORKERS = 4            # 동시 뉴스 수집 워커 수 (요청 속도는 PortalRateLimiter가 포털별로 제한)
+STAGE_QUEUE_SIZE = 8        # 단계 간 큐 크기 (백프레셔)
+ANALYSIS_CHUNK_SIZE = 15    # 이 개수만큼 뉴스가 쌓이면 AI 분석 청크 시작
+CANCEL_POLL_INTERVAL = 0.2
+SCAN_POLL_INTERVAL = 0.3    # 화면에서 백그라운드 스캔 진행률을 확인하는 간격
+
+async def _fetch_rankings():
+    (df_k, err_k), (df_q, err_q) = await asyncio.gather(
+        asyncio.to_thread(fetch_market_rows, 0, '코스피'),
+        asyncio.to_thread(fetch_market_rows, 1, '코스닥'),
+    )
+    return pd.concat([df_k, df_q], ignore_index=True), [e for e in (err_k, err_q) if e]
+
+async def _scan_pipeline(cancel_event, on_progress=None, rate_limiter=None):
+    def check_cancelled():
+        # 새 뉴스 요청·Gemini 호출을 시작하기 직전마다 확인 (이미 시작된 호출은 끊을 수 없음)
+        if cancel_event.is_set():
+            raise asyncio.CancelledError()
+
+    # [1단계] 코스피/코스닥 랭킹 동시 수집
+    raw_df, errors = await _fetch_rankings()
+    df = select_leader_candidates(raw_df)
+    scan = {"raw_empty": raw_df.empty, "errors": errors, "warnings": [], "df": df, "news_payload": {}, "briefing": "", "analysis": []}
+    if df.empty:
+        return scan
+    
+    stocks = df['종목명'].tolist()
+    candidate_q = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+    news_q = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+    news_payload = {}
+
+    async def produce_candidates():
+        for name in stocks:
+            await candidate_q.put(name)
+        for _ in range(NEWS_WORKERS):
+            await candidate_q.put(None)
+
+    # [2단계] 후보가 큐에 들어오는 즉시 뉴스 수집
+    async def news_worker():
+        while True:
+            name = await candidate_q.get()
+            if name is None:
+                await news_q.put(None)
+                return
+            check_cancelled()
+            headlines = await asyncio.to_thread(fetch_stock_news_headlines, name, rate_limiter)
+            await news_q.put((name, headlines))
+
+    # [3단계] 뉴스가 청크 크기만큼 쌓이면 바로 AI 분석 시작
+    async def analysis_stage():
+        buffer, chunks, chunk_sizes, finished = {}, [], [], 0
+        while finished < NEWS_WORKERS:
+            item = await news_q.get()
+            if item is None:
+                finished += 1
+                continue
+            name, headlines = item
+            news_payload[name] = headlines
+            buffer[name] = headlines
+            if on_progress: on_progress(len(news_payload), len(stocks))
+            if len(buffer) >= ANALYSIS_CHUNK_SIZE:
+                check_cancelled()
+                chunks.append(asyncio.create_task(asyncio.to_thread(perform_batch_analysis, buffer)))
+                chunk_sizes.append(len(buffer))
+                buffer = {}
+        if buffer:
+            check_cancelled()
+            chunks.append(asyncio.create_task(asyncio.to_thread(perform_batch_analysis, buffer)))
+            chunk_sizes.append(len(buffer))
+        return list(zip(chunk_sizes, await asyncio.gather(*chunks)))
+
+    *_, chunk_results = await asyncio.gather(
+        produce_candidates(),
+        *(news_worker() for _ in range(NEWS_WORKERS)),
+        analysis_stage(),
+    )
+    
+    # 청크별 결과 병합 (뉴스는 등락률 순서 유지, 실패한 청크는 제외)
+    scan["news_payload"] = {name: news_payload[name] for name in stocks if name in news_payload}
+    successes = [(brief, items) for _, (brief, items, ok) in chunk_results if ok]
+    if not successes:
+        # 모든 청크 실패 → 첫 오류 안내를 그대로 표시
+        scan["briefing"], scan["analysis"], _ = chunk_results[0][1]
+        return scan
+    
+    # 일부 청크 실패 → 부분 분석임을 화면에 알림 (실패 종목은 개별주로 표시됨)
+    for size, (brief, _, ok) in chunk_results:
+        if not ok:
+            scan["warnings"].append(f"⚠️ AI 분석 일부 실패: {size}개 종목 미분석 ({brief})")
+    
+    records = [rec for _, items in successes for rec in items]
+    briefing = successes[0][0]
+    if len(successes) > 1:
+        # [4단계] 청크마다 따로 붙은 태그를 전체 기준으로 통일하고 브리핑을 한 번만 작성
+        check_cancelled()
+        final_brief, unified = await asyncio.to_thread(perform_final_briefing, records)
+        briefing = final_brief or briefing
+        records = [replace(rec, sectors=unified.get(rec.name, rec.sectors)) for rec in records]
+    scan["briefing"] = briefing
+    scan["analysis"] = records
+    return scan
+
+async def _run_cancellable(coro, cancel_event):
+    task = asyncio.ensure_future(coro)
+    while not task.done():
+        if cancel_event.is_set():
+            task.cancel()
+            break
+        await asyncio.wait({task}, timeout=CANCEL_POLL_INTERVAL)
+    try:
+        return await task
+    except asyncio.CancelledError:
+        return None
+
+def run_scan_pipeline(cancel_event, on_progress=None, rate_limiter=None):
+    """전체 스캔 실행. cancel_event가 설정되면(새 스캔 시작) 중단하고 None 반환"""
+    return asyncio.run(_run_cancellable(_scan_pipeline(cancel_event, on_progress, rate_limiter), cancel_event))
+
+class ScanJob:
+    """세션별 백그라운드 스캔. 스크립트 실행과 별개로 돌기 때문에 재실행 중에도 계속되고, 새 스캔이 확실히 취소할 수 있다"""
+
+    def __init__(self, rate_limiter):
+        self.cancel_event = threading.Event()
+        self.progress = (0, 0)
+        self.result = None
+        self._thread = threading.Thread(target=self._run, args=(rate_limiter,), daemon=True)
+        self._thread.start()
+
+    def _run(self, rate_limiter):
+        self.result = run_scan_pipeline(self.cancel_event, on_progress=self._set_progress, rate_limiter=rate_limiter)
+
+    def _set_progress(self, done, total):
+        self.progress = (done, total)
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+class ScanJobRegistry:
+    """세션 ID → 진행 중이거나 결과를 아직 가져가지 않은 ScanJob (여러 세션 스레드가 공유)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def get(self, session_id):
+        with self._lock:
+            return self._jobs.get(session_id)
+
+    def start(self, session_id, rate_limiter):
+        """이전 스캔은 취소하고 새 스캔 시작"""
+        with self._lock:
+            # 종료된 세션이 남긴 작업 정리
+            for sid in [sid for sid in self._jobs if sid != session_id and not is_session_active(sid)]:
+                self._jobs.pop(sid).cancel()
+            prev_job = self._jobs.get(session_id)
+            if prev_job is not None: prev_job.cancel()
+            self._jobs[session_id] = ScanJob(rate_limiter)
+            return self._jobs[session_id]
+
+    def finish(self, session_id, job):
+        with self._lock:
+            if self._jobs.get(session_id) is job:
+                del self._jobs[session_id]
+
+@st.cache_resource
+def get_scan_jobs():
+    return ScanJobRegistry()
+
+# --- [6] 실시간 시세 갱신 (뉴스/AI 재분석 없이 등락률·거래대금만 갱신) ---
+
+PRICE_REFRESH_INTERVAL = 5
+PRICE_COLUMNS = ['등락률', '거래대금', '등락률_num', '거래대금_num']
+
+def refresh_leader_prices(df):
+    """랭킹 페이지만 재수집해 분석 완료 종목의 시세만 갱신한 사본을 등락률 순으로 재정렬. (갱신 df, 신규 진입 종목, 에러) 반환 - 수집 실패 시 df는 None"""
+    raw_df, errors = asyncio.run(_fetch_rankings())
+    if raw_df.empty:
+        return None, [], errors
+    
+    # 스냅샷은 공유·불변이므로 시세 열만 바꾼 사본을 만든다 (섹터/뉴스는 그대로 공유)
+    df = df.copy()
+    quotes = parse_numeric_columns(raw_df).drop_duplicates('종목명').set_index('종목명')
+    for col in PRICE_COLUMNS:
+        latest = df['종목명'].map(quotes[col])
+        # 랭킹 페이지에서 빠진 종목은 직전 시세 유지
+        df[col] = latest.where(latest.notna(), df[col])
+    df = df.sort_values(by='등락률_num', ascending=False)
+    
+    # 조건을 새로 충족한 종목은 다음 전체 스캔 때 분석하도록 표시만 함
+    analyzed = set(df['종목명'])
+    new_entrants = [name for name in select_leader_candidates(raw_df)['종목명'] if name not in analyzed]
+    return df, new_entrants, errors
+
+# --- [7] 공유 스냅샷 저장소 (세션 간 결과 공유 및 메모리 상한) ---
+
+MAX_SNAPSHOTS = 8
+
+@dataclass(frozen=True)
+class ScanSnapshot:
+    """한 번의 스캔(또는 시세 갱신) 결과. 여러 세션이 같은 객체를 참조하므로 읽기 전용으로만 사용"""
+    version: int
+    created_at: str
+    priced_at: float
+    df: pd.DataFrame
+    news_payload: MappingProxyType
+    analysis: tuple
+    briefing: str
+    pending_entrants: tuple = ()
+
+def _intern(val):
+    return sys.intern(val) if isinstance(val, str) else val
+
+def _intern_tuple(values):
+    return tuple(_intern(str(v)) for v in values)
+
+def freeze_scan_frame(df):
+    """반복되는 문자열은 intern, 시장은 category dtype, 섹터는 불변 tuple로 변환한 사본"""
+    df = df.copy()
+    df['종목명'] = df['종목명'].map(_intern)
+    df['시장'] = df['시장'].astype('category')
+    if '섹터' in df.columns:
+        df['섹터'] = df['섹터'].map(lambda secs: _intern_tuple(force_list(secs)))
+    return df
+
+def freeze_news_payload(news_payload):
+    return MappingProxyType({_intern(name): _intern_tuple(headlines) for name, headlines in news_payload.items()})
+
+def _deep_size(obj, seen=None):
+    """객체가 참조하는 메모리 추정치 (intern 문자열처럼 이미 센 객체는 한 번만 계산)"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        # 숫자·category 열은 배열 크기, object 열(종목명·섹터 tuple 등)은 원소까지 seen 기준으로 합산
+        size = int(obj.memory_usage(deep=False).sum())
+        for col in obj.columns:
+            if obj[col].dtype == object:
+                size += sum(_deep_size(v, seen) for v in obj[col])
+        return size
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (dict, MappingProxyType)):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_size(v, seen) for v in obj)
+    elif is_dataclass(obj) and not isinstance(obj, type):
+        # ScanSnapshot, StockAnalysis 등 레코드는 필드 값까지 합산
+        size += sum(_deep_size(getattr(obj, f.name), seen) for f in fields(obj))
+    return size
+
+def format_bytes(n):
+    return f"{n / 1024 / 1024:.2f} MB" if n >= 1024 * 1024 else f"{n / 1024:.1f} KB"
+
+class SnapshotStore:
+    """서버 공용 스냅샷 저장소. 세션이 참조 중인 버전은 유지하고, 참조 없는 버전은 최근 MAX_SNAPSHOTS개까지만 보관"""
+
+    def __init__(self, max_snapshots=MAX_SNAPSHOTS):
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()
+        self._session_refs = {}
+        self._max_snapshots = max_snapshots
+        self._next_version = 1
+
+    def publish(self, df, news_payload, analysis, briefing, pending_entrants=(), base_version=None):
+        """base_version(시세 갱신의 기준 버전)이 그 사이 최신이 아니게 됐다면 갱신본을 버리고 최신 스냅샷 반환"""
+        with self._lock:
+            if base_version is not None and self._snapshots and next(reversed(self._snapshots)) != base_version:
+                # 갱신 중 다른 세션의 전체 스캔이 올라옴 → 옛 분석을 최신으로 덮어쓰지 않음
+                return next(reversed(self._snapshots.values()))
+            snapshot = ScanSnapshot(
+                version=self._next_version,
+                created_at=get_kst_time(),
+                priced_at=time.time(),
+                df=df,
+                news_payload=news_payload,
+                analysis=tuple(analysis),
+                briefing=briefing,
+                pending_entrants=tuple(pending_entrants),
+            )
+            self._next_version += 1
+            self._snapshots[snapshot.version] = snapshot
+            self._prune_sessions()
+            self._evict()
+            return snapshot
+
+    def _prune_sessions(self):
+        # 종료된 세션의 참조 제거
+        self._session_refs = {sid: v for sid, v in self._session_refs.items() if is_session_active(sid)}
+
+    def _evict(self):
+        pinned = set(self._session_refs.values())
+        # 오래된 것부터, 최신 버전과 세션이 참조 중인 버전은 제외하고 제거
+        for version in list(self._snapshots)[:-1]:
+            if len(self._snapshots) <= self._max_snapshots:
+                break
+            if version not in pinned:
+                del self._snapshots[version]
+
+    def get(self, version):
+        """요청한 버전이 없으면(새 세션 등) 최신 스냅샷 반환"""
+        with self._lock:
+            if version in self._snapshots:
+                return self._snapshots[version]
+            return next(reversed(self._snapshots.values()), None)
+
+    def pin(self, session_id, version):
+        with self._lock:
+            self._session_refs[session_id] = version
+
+    def memory_report(self):
+        """(스냅샷별 행, 전체 고유 바이트). '메모리'는 스냅샷 단독 크기, '고유 메모리'는 앞선 스냅샷과 공유하는 객체를 제외한 크기"""
+        with self._lock:
+            self._prune_sessions()
+            snapshots = list(self._snapshots.values())
+            refs = list(self._session_refs.values())
+        shared_seen = set()
+        rows, total_unique = [], 0
+        for snap in snapshots:
+            unique = _deep_size(snap, shared_seen)
+            total_unique += unique
+            rows.append({
+                "버전": snap.version,
+                "생성시각": snap.created_at,
+                "종목수": len(snap.df),
+                "메모리": format_bytes(_deep_size(snap)),
+                "고유 메모리": format_bytes(unique),
+                "참조 세션": refs.count(snap.version),
+            })
+        return rows, total_unique
+
+@st.cache_resource
+def get_snapshot_store():
+    return SnapshotStore()
+
+def get_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
+
+def is_session_active(session_id):
+    return runtime.exists() and runtime.get_instance().is_active_session(session_id)
+
+def session_memory_bytes():
+    """세션이 직접 보유한 메모리 (공유 스냅샷 제외)"""
+    seen = set()
+    return sum(_deep_size(v, seen) for v in st.session_state.values())
+
+# --- [8] 테마 흐름 시계열 (스캔 간 섹터 순환 추적) ---
+
+THEME_FLOW_HISTORY = 60  # 테마별로 보관하는 최근 스캔 수 (링버퍼 크기)
+
+def group_rows_by_theme(df):
+    """섹터 태그별 종목 레코드 묶음 ('(개별주)' 태그 제외). 같은 레코드를 여러 테마가 공유"""
+    theme_rows = {}
+    for row in df.to_dict('records'):
+        for sec in force_list(row['섹터']):
+            if '(개별주)' in sec or sec == '개별주':
+                continue
+            theme_rows.setdefault(sec, []).append(row)
+    return theme_rows
+
+@dataclass
+class ThemeFlow:
+    first_seen: str
+    counts: deque
+    volumes: deque
+    leader: str = None
+    leader_changes: int = 0
+
+class ThemeFlowTracker:
+    """스캔마다 테마별 종목수·거래대금을 링버퍼에 누적하는 증분 집계기"""
+
+    def __init__(self, history=THEME_FLOW_HISTORY):
+        self._lock = threading.Lock()
+        self._history = history
+        self._ticks = deque(maxlen=history)
+        self._themes = {}
+
+    def ingest(self, df, scanned_at):
+        theme_rows = group_rows_by_theme(df)
+        with self._lock:
+            self._ticks.append(scanned_at)
+            for name in theme_rows.keys() - self._themes.keys():
+                # 새 테마는 지난 스캔 구간을 0으로 채워 시간축을 맞춤
+                pad = len(self._ticks) - 1
+                self._themes[name] = ThemeFlow(
+                    first_seen=scanned_at,
+                    counts=deque([0] * pad, maxlen=self._history),
+                    volumes=deque([0.0] * pad, maxlen=self._history),
+                )
+            for name, flow in list(self._themes.items()):
+                rows = theme_rows.get(name, [])
+                flow.counts.append(len(rows))
+                flow.volumes.append(float(sum(r['거래대금_num'] for r in rows if pd.notna(r['거래대금_num']))))
+                if rows:
+                    leader = max(rows, key=lambda r: r['등락률_num'])['종목명']
+                    if flow.leader is not None and leader != flow.leader:
+                        flow.leader_changes += 1
+                    flow.leader = leader
+                elif len(flow.counts) == self._history and not any(flow.counts):
+                    # 보관 구간 내내 사라진 테마는 정리
+                    del self._themes[name]
+
+    def summary(self):
+        """테마별 현재 상태와 추이. 테마 수에만 비례 (링버퍼 크기는 고정)"""
+        with self._lock:
+            rows = []
+            for name, flow in self._themes.items():
+                count = flow.counts[-1]
+                prev = flow.counts[-2] if len(flow.counts) > 1 else 0
+                rows.append({
+                    "테마": name,
+                    "종목수": count,
+                    "증감": count - prev,
+                    "거래대금": format_volume_to_jo_eok(flow.volumes[-1]),
+                    "대장": flow.leader or "-",
+                    "대장 교체": flow.leader_changes,
+                    "최초 포착": flow.first_seen,
+                    "종목수 추이": list(flow.counts),
+                    "거래대금 추이(억)": [int(v / 100) for v in flow.volumes],
+                    "_volume": flow.volumes[-1],
+                })
+            return len(self._ticks), rows
+
+@st.cache_resource
+def get_theme_flow_tracker():
+    return ThemeFlowTracker()
+
+# --- [9] UI 레이아웃 구성 ---
 
 with st.sidebar:
     # 🌟 사이드바 여백 정리
@@ -590,144 +1229,177 @@ with st.sidebar:
 st.markdown("<div class='main-title'>🔑 Golden Key Pro</div>", unsafe_allow_html=True)
 st.markdown("<div class='sub-title'>탑티어 퀀트 트레이딩 & 실시간 주도주 분석 대시보드</div>", unsafe_allow_html=True)
 
-tab_scanner, tab_analysis = st.tabs(["🚀 실시간 주도주 스캐너", "📰 종목별 상세 뉴스"])
+tab_scanner, tab_analysis, tab_flow = st.tabs(["🚀 실시간 주도주 스캐너", "📰 종목별 상세 뉴스", "📈 테마 흐름"])
 
-with tab_scanner:
+snapshot_store = get_snapshot_store()
+theme_flow = get_theme_flow_tracker()
+snapshot = snapshot_store.get(st.session_state.snapshot_version)
+
+def pin_snapshot(snap):
+    st.session_state.snapshot_version = snap.version
+    snapshot_store.pin(get_session_id(), snap.version)
+    return snap
+
+def publish_snapshot(**fields):
+    """새 스냅샷을 공유 저장소에 올리고 현재 세션에 고정"""
+    return pin_snapshot(snapshot_store.publish(**fields))
+
+if snapshot is not None: pin_snapshot(snapshot)
+
+def render_leader_board():
+    """주도주 카드와 섹터 랭킹. 실시간 시세 모드에서는 이 부분만 주기적으로 다시 그린다"""
+    snapshot = snapshot_store.get(st.session_state.snapshot_version)
+    if snapshot is not None and st.session_state.get("live_prices"):
+        # 다른 세션이 이미 갱신한 최신 스냅샷이 있으면 그대로 공유
+        snapshot = pin_snapshot(snapshot_store.get(None))
+        if time.time() - snapshot.priced_at >= PRICE_REFRESH_INTERVAL:
+            priced_df, new_entrants, errors = refresh_leader_prices(snapshot.df)
+            for err in errors:
+                st.error(err)
+            # 수집 실패 시 새 스냅샷을 만들지 않고 기존 결과 유지
+            if priced_df is not None:
+                snapshot = publish_snapshot(
+                    df=priced_df,
+                    news_payload=snapshot.news_payload,
+                    analysis=snapshot.analysis,
+                    briefing=snapshot.briefing,
+                    pending_entrants=_intern_tuple(new_entrants),
+                    base_version=snapshot.version,
+                )
+    if snapshot is not None and snapshot.pending_entrants:
+        st.caption(f"🆕 신규 진입 (다음 스캔 시 분석): {', '.join(snapshot.pending_entrants)}")
+    
     col_main, col_summary = st.columns([7, 3])
     with col_summary:
         st.markdown("<h3 style='font-size: 1.3rem; font-weight: 800; margin-bottom: 15px; color: #0f172a;'>🏆 주도 섹터 랭킹</h3>", unsafe_allow_html=True)
-        summary_placeholder = st.empty()
-        
+    if snapshot is None or snapshot.df.empty:
+        return
+    
     with col_main:
-        if st.button("🚀 국내 실시간 스캔 및 AI 분석 실행", use_container_width=True):
-            with st.spinner("1/2. 실시간 시장 수급 분석 중..."):
-                df_k = fetch_market_data(0, '코스피')
-                df_q = fetch_market_data(1, '코스닥')
-                df = pd.concat([df_k, df_q], ignore_index=True)
+        for _, row in snapshot.df.iterrows():
+            badges_html = ""
+            safe_sectors = force_list(row['섹터'])
+            for sec in safe_sectors:
+                bg = get_sector_color(sec)
+                badges_html += f'<span class="sector-badge" style="background: {bg}; color: #1e293b;">{sec}</span>'
                 
-                if df.empty:
-                    st.warning("⚠️ 네이버 금융에서 데이터를 가져오지 못했습니다.")
-                else:
-                    # 1. 노이즈 제거 (KODEX, 스팩 등)
-                    df = df[~df['종목명'].str.contains('KODEX|TIGER|ACE|SOL|KBSTAR|HANARO|KOSEF|ARIRANG|스팩|ETN|선물|인버스|레버리지|VIX|옵션|마이티|히어로즈|TIMEFOLIO', na=False)]
-                    
-                    # 2. 데이터 타입 변환
-                    df['등락률_num'] = pd.to_numeric(df['등락률'].str.replace(r'%|\+', '', regex=True), errors='coerce')
-                    df['거래대금_num'] = pd.to_numeric(df['거래대금'].str.replace(',', ''), errors='coerce')
-                    
-                    # 🌟 [수정 로직] 코스피/코스닥 합산 후 거래대금 순 상위 100위 추출
-                    df = df.sort_values(by='거래대금_num', ascending=False).head(100)
-                    
-                    # 🌟 [수정 로직] 그중 상승률 4.0% 이상인 종목 필터링 후 등락률 순 정렬
-                    df = df[df['등락률_num'] >= 4.0].sort_values(by='등락률_num', ascending=False)
+            rv = row['등락률_num']; rt_c = "#ef4444" if rv >= 20.0 else ("#22c55e" if rv >= 10.0 else "#1e293b")
+            border_c = "#3b82f6" if rv >= 20.0 else ("#10b981" if rv >= 10.0 else "#cbd5e1")
+                
+            st.markdown(f'''
+            <div class="stock-card" style="border-left-color: {border_c};">
+                <div class="left-zone">
+                    <span class="market-tag {"market-kospi" if row["시장"]=="코스피" else "market-kosdaq"}">{row["시장"]}</span>
+                    <span class="stock-name">{row["종목명"]}</span>
+                </div>
+                <div class="center-zone">{badges_html}</div>
+                <div class="right-zone">
+                    <span style="color: {rt_c}; font-weight: 800; font-size: 1.15rem; min-width: 70px; text-align: right;">{rv:+}%</span>
+                    <span class="stock-vol">{format_volume_to_jo_eok(row["거래대금_num"])}</span>
+                </div>
+            </div>
+            ''', unsafe_allow_html=True)
+    
+    with col_summary:
+        # 테마별 DataFrame 사본 대신 같은 행 레코드를 여러 테마가 참조
+        theme_counts = group_rows_by_theme(snapshot.df)
+                
+        sorted_themes = sorted(theme_counts.items(), key=lambda x: (len(x[1]), sum(r['거래대금_num'] for r in x[1])), reverse=True)
+                
+        for s_name, stocks_list in sorted_themes:
+            stocks_list = sorted(stocks_list, key=lambda r: r['등락률_num'], reverse=True)
                     
-            if not df.empty:
-                with st.spinner(f"2/2. AI 트레이더의 주도장세 분석 중... ({len(df)}개 종목)"):
-                    news_payload = {}
+            with st.expander(f"{s_name} ({len(stocks_list)})", expanded=True):
+                for idx_l, s_row in enumerate(stocks_list):
+                    ldr = '<span class="leader-label">대장</span>' if idx_l == 0 else ''
+                    rv = s_row["등락률_num"]
+                    rate_color = "#ef4444" if rv >= 20.0 else ("#22c55e" if rv >= 10.0 else "#334155")
+                            
+                    st.markdown(f'''
+                    <div class="sector-item">
+                        <div class="sector-item-left">{ldr}<span class="sector-stock-name">{s_row["종목명"]}</span></div>
+                        <div class="sector-item-right">
+                            <span class="val-rate" style="color:{rate_color};">{rv:+}%</span>
+                            <span class="val-vol">{format_volume_to_jo_eok(s_row["거래대금_num"])}</span>
+                        </div>
+                    </div>
+                    ''', unsafe_allow_html=True)
+
+with tab_scanner:
+    col_main, _ = st.columns([7, 3])
+    with col_main:
+        if st.button("🚀 국내 실시간 스캔 및 AI 분석 실행", use_container_width=True):
+            # 진행 중인 이전 스캔은 취소하고 새 백그라운드 스캔 시작
+            get_scan_jobs().start(get_session_id(), get_portal_rate_limiter())
+        
+        scan_job = get_scan_jobs().get(get_session_id())
+        if scan_job is not None:
+            if scan_job.running:
+                with st.spinner("실시간 시장 수급 및 AI 트레이더의 주도장세 분석 중..."):
                     progress_bar = st.progress(0)
-                    stocks = df['종목명'].tolist()
-                    
-                    for i, name in enumerate(stocks):
-                        news_payload[name] = fetch_stock_news_headlines(name)
-                        progress_bar.progress((i + 1) / len(stocks))
-                        time.sleep(1.0) 
-                    
-                    st.session_state.news_payload = news_payload
-                    
-                    market_brief, ai_results = perform_batch_analysis(news_payload)
-                    st.session_state.market_briefing = market_brief
-                    st.session_state.analysis_results = ai_results
+                    # 스크립트가 재실행돼도 작업은 계속되며, 다음 실행이 이어서 진행률을 표시하고 결과를 가져감
+                    while scan_job.running:
+                        done, total = scan_job.progress
+                        progress_bar.progress(done / total if total else 0.0, text=f"뉴스 수집 {done}/{total}")
+                        time.sleep(SCAN_POLL_INTERVAL)
+            get_scan_jobs().finish(get_session_id(), scan_job)
+            scan = scan_job.result
+            
+            if scan is not None:
+                for err in scan["errors"]:
+                    st.error(err)
+                for warn in scan["warnings"]:
+                    st.warning(warn)
+                if scan["raw_empty"]:
+                    st.warning("⚠️ 네이버 금융에서 데이터를 가져오지 못했습니다.")
+                
+                df = scan["df"]
+                if not df.empty:
+                    ai_results = scan["analysis"]
                     
-                    sector_dict = {}
-                    for item in ai_results:
-                        if isinstance(item, dict):
-                            s_name = item.get("종목명", "")
-                            sectors = force_list(item.get("섹터", ["개별주"]))
-                            sector_dict[s_name] = sectors
+                    sector_dict = {rec.name: rec.sectors for rec in ai_results}
                             
                     df['섹터'] = df['종목명'].apply(lambda x: force_list(sector_dict.get(x, ['개별주'])))
-                    st.session_state.domestic_df = df
-            else:
-                st.info("ℹ️ 현재 조건(상위 100위 내 +4% 이상)에 맞는 주도주가 없습니다.")
+                    snapshot = publish_snapshot(
+                        df=freeze_scan_frame(df),
+                        news_payload=freeze_news_payload(scan["news_payload"]),
+                        analysis=ai_results,
+                        briefing=scan["briefing"],
+                    )
+                    # 테마 흐름은 전체 스캔만 누적 (시세 갱신본은 섹터 구성이 같아 제외)
+                    theme_flow.ingest(snapshot.df, snapshot.created_at)
+                else:
+                    st.info("ℹ️ 현재 조건(상위 100위 내 +4% 이상)에 맞는 주도주가 없습니다.")
+
+        if snapshot is not None:
+            st.toggle(f"⏱️ 실시간 시세 갱신 ({PRICE_REFRESH_INTERVAL}초, 뉴스/AI 제외)", key="live_prices")
 
-        if st.session_state.market_briefing:
+        if snapshot is not None and snapshot.briefing:
             st.markdown(f'''
             <div class="briefing-box">
                 <div class="briefing-title">🎙️ AI 트레이더의 오늘의 시장 브리핑</div>
-                {st.session_state.market_briefing}
+                {snapshot.briefing}
             </div>
             ''', unsafe_allow_html=True)
 
-        if not st.session_state.domestic_df.empty:
-            for _, row in st.session_state.domestic_df.iterrows():
-                badges_html = ""
-                safe_sectors = force_list(row['섹터'])
-                for sec in safe_sectors:
-                    bg = get_sector_color(sec)
-                    badges_html += f'<span class="sector-badge" style="background: {bg}; color: #1e293b;">{sec}</span>'
-                
-                rv = row['등락률_num']; rt_c = "#ef4444" if rv >= 20.0 else ("#22c55e" if rv >= 10.0 else "#1e293b")
-                border_c = "#3b82f6" if rv >= 20.0 else ("#10b981" if rv >= 10.0 else "#cbd5e1")
-                
-                st.markdown(f'''
-                <div class="stock-card" style="border-left-color: {border_c};">
-                    <div class="left-zone">
-                        <span class="market-tag {"market-kospi" if row["시장"]=="코스피" else "market-kosdaq"}">{row["시장"]}</span>
-                        <span class="stock-name">{row["종목명"]}</span>
-                    </div>
-                    <div class="center-zone">{badges_html}</div>
-                    <div class="right-zone">
-                        <span style="color: {rt_c}; font-weight: 800; font-size: 1.15rem; min-width: 70px; text-align: right;">+{rv}%</span>
-                        <span class="stock-vol">{format_volume_to_jo_eok(row["거래대금_num"])}</span>
-                    </div>
-                </div>
-                ''', unsafe_allow_html=True)
-            
-            with summary_placeholder.container():
-                theme_counts = {}
-                for idx, row in st.session_state.domestic_df.iterrows():
-                    safe_sectors = force_list(row['섹터'])
-                    for sec in safe_sectors:
-                        if '(개별주)' in sec or sec == '개별주': 
-                            continue
-                        if sec not in theme_counts: theme_counts[sec] = []
-                        theme_counts[sec].append(row)
-                
-                sorted_themes = sorted(theme_counts.items(), key=lambda x: (len(x[1]), sum(r['거래대금_num'] for r in x[1])), reverse=True)
-                
-                for s_name, stocks_list in sorted_themes:
-                    stocks_df = pd.DataFrame(stocks_list).sort_values('등락률_num', ascending=False)
-                    
-                    with st.expander(f"{s_name} ({len(stocks_df)})", expanded=True):
-                        for idx_l, (_, s_row) in enumerate(stocks_df.iterrows()):
-                            ldr = '<span class="leader-label">대장</span>' if idx_l == 0 else ''
-                            rv = s_row["등락률_num"]
-                            rate_color = "#ef4444" if rv >= 20.0 else ("#22c55e" if rv >= 10.0 else "#334155")
-                            
-                            st.markdown(f'''
-                            <div class="sector-item">
-                                <div class="sector-item-left">{ldr}<span class="sector-stock-name">{s_row["종목명"]}</span></div>
-                                <div class="sector-item-right">
-                                    <span class="val-rate" style="color:{rate_color};">+{rv}%</span>
-                                    <span class="val-vol">{format_volume_to_jo_eok(s_row["거래대금_num"])}</span>
-                                </div>
-                            </div>
-                            ''', unsafe_allow_html=True)
+    # 실시간 시세 모드에서는 카드·랭킹 영역만 fragment로 주기 재실행 (앱 전체 재실행 없음)
+    live_prices = st.session_state.get("live_prices") and snapshot is not None
+    st.fragment(render_leader_board, run_every=PRICE_REFRESH_INTERVAL if live_prices else None)()
 
 with tab_analysis:
     st.markdown("<h3 style='font-size: 1.3rem; font-weight: 800; margin-bottom: 5px; color: #0f172a;'>📰 AI 요약 및 종목별 특징주 리스트</h3>", unsafe_allow_html=True)
-    if not st.session_state.news_payload:
+    if snapshot is None or not snapshot.news_payload:
         st.info("👈 [실시간 주도주 스캐너] 탭에서 스캔을 먼저 실행해 주세요.")
     else:
         st.markdown("<p style='color:#64748b; font-size: 0.95rem; margin-bottom: 25px;'>스캔된 주도주들의 AI 상승 요약, <b>논리적 추론 과정</b>, 그리고 최근 기사(본문 포함)를 상세하게 확인합니다.</p>", unsafe_allow_html=True)
         
-        for stock, headlines in st.session_state.news_payload.items():
+        for stock, headlines in snapshot.news_payload.items():
             ai_reason = "최근 뚜렷한 재료 발견 안됨"
             ai_cot = "추론 과정 없음"
-            for item in st.session_state.analysis_results:
-                if isinstance(item, dict) and item.get("종목명") == stock:
-                    ai_reason = item.get("이유", ai_reason)
-                    ai_cot = item.get("분석과정", "추론 데이터가 없습니다.")
+            for rec in snapshot.analysis:
+                if rec.name == stock:
+                    ai_reason = rec.reason
+                    ai_cot = rec.reasoning
                     break
             
             news_li_html = ""
@@ -753,4 +1425,30 @@ with tab_analysis:
                 </ul>
             </div>
             """
-            st.markdown(card_html, unsafe_allow_html=True)
\ No newline at end of file
+            st.markdown(card_html, unsafe_allow_html=True)
+
+with tab_flow:
+    st.markdown("<h3 style='font-size: 1.3rem; font-weight: 800; margin-bottom: 5px; color: #0f172a;'>📈 테마 흐름 (섹터 순환 추적)</h3>", unsafe_allow_html=True)
+    tick_count, flow_rows = theme_flow.summary()
+    if not flow_rows:
+        st.info("👈 [실시간 주도주 스캐너] 탭에서 스캔을 먼저 실행해 주세요.")
+    else:
+        st.markdown(f"<p style='color:#64748b; font-size: 0.95rem; margin-bottom: 15px;'>최근 <b>{tick_count}회</b> 스캔 동안 테마별 편입 종목수와 거래대금 변화를 보여줍니다.</p>", unsafe_allow_html=True)
+        flow_df = pd.DataFrame(flow_rows).sort_values(by=["종목수", "_volume"], ascending=False).drop(columns="_volume")
+        st.dataframe(
+            flow_df,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "종목수 추이": st.column_config.LineChartColumn("종목수 추이", y_min=0),
+                "거래대금 추이(억)": st.column_config.LineChartColumn("거래대금 추이(억)", y_min=0),
+            },
+        )
+
+with st.sidebar:
+    with st.expander("🧠 메모리 사용량"):
+        st.caption(f"현재 세션 보유: {format_bytes(session_memory_bytes())} · 참조 스냅샷: v{st.session_state.snapshot_version or '-'}")
+        report, total_unique = snapshot_store.memory_report()
+        if report:
+            st.caption(f"스냅샷 전체(공유 객체는 한 번만 계산): {format_bytes(total_unique)}")
+            st.dataframe(pd.DataFrame(report), hide_index=True, use_container_width=True)